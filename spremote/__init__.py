@@ -10,6 +10,8 @@ from .hub import Hub
 from .light_matrix import LightMatrix
 from .motion_sensor import MotionSensor
 from .motor import Motor
+from .runner import Runner
+from .trajectory import Trajectory
 
 
 __all__ = [
@@ -20,5 +22,7 @@ __all__ = [
     'Hub',
     'LightMatrix',
     'MotionSensor',
-    'Motor'
+    'Motor',
+    'Runner',
+    'Trajectory'
 ]
@@ -1,6 +1,74 @@
+import ast
+import sys
+import threading
+import time
+
 import serial
 
 from . import logger
+from .color_sensor import ColorSensor
+from .distance_sensor import DistanceSensor
+from .force_sensor import ForceSensor
+from .motor import Motor
+
+# comment sent after each command to detect end of outputs
+_MARKER = '<<<done>>>'
+
+# prefix of hub's output line containing compile and execution times
+_PROF_MARKER = '<<<prof>>>'
+
+# device classes for device IDs
+_DEVICE_CLASSES = {
+    48: Motor,  # medium motor
+    49: Motor,  # large motor
+    65: Motor,  # small motor
+    75: Motor,  # technic medium motor
+    76: Motor,  # technic large motor
+    61: ColorSensor,
+    62: DistanceSensor,
+    63: ForceSensor
+}
+
+# code for reading IDs and maximum motor speeds of all ports in one command
+_INVENTORY_CODE = f'''
+def _inv():
+    r = []
+    for p in range(6):
+        try:
+            i = device.id(p)
+        except:
+            i = 0
+        s = None
+        if i in {tuple(i for i, c in _DEVICE_CLASSES.items() if c is Motor)!r}:
+            s = motor.info(p)[1]
+        r.append((i, s))
+    print(r)
+'''
+
+# code for timing commands on the hub (sent when profiling is enabled);
+# statements are compiled one by one like in the interactive interpreter
+_PROF_CODE = f'''
+def _prof(srcs):
+    g = globals()
+    tc = 0
+    te = 0
+    for src in srcs:
+        t0 = time.ticks_us()
+        try:
+            c = compile(src, '<stdin>', 'single')
+        except Exception as e:
+            sys.print_exception(e)
+            continue
+        t1 = time.ticks_us()
+        try:
+            exec(c, g)
+        except Exception as e:
+            sys.print_exception(e)
+        t2 = time.ticks_us()
+        tc += time.ticks_diff(t1, t0)
+        te += time.ticks_diff(t2, t1)
+    print('{_PROF_MARKER}', tc, te)
+'''
 
 class Hub:
     ''' Connection related functionality of a hub block (no sensors, buttons,
@@ -29,6 +97,25 @@ class Hub:
         if greeting[-1] != b'>>> ':
             logger.warning('Python interpreter does not show >>>.')
         
+        # macros defined on the hub (name: (argument names, motors))
+        self.macros = {}
+        self.recording = None
+        self.recorded_motors = set()
+        
+        # True while code sent without waiting for results is running
+        self.pending = False
+        
+        # profiling records (see set_profiling)
+        self.profiling = False
+        self.profile = []
+        
+        # serializes commands from different threads (see watch_devices)
+        self._cmd_lock = threading.RLock()
+        self.watcher = None
+        self.watching = None
+        self.checking_ports = False  # True while watcher checks ports
+        self.inventory_defined = False
+        
         # prepare for device listing
         self.cmd('import device')
         
@@ -38,6 +125,7 @@ class Hub:
         Close serial connection to hub.
         '''
         
+        self.stop_watching()
         self.connection.close()
         
 
@@ -112,7 +200,151 @@ class Hub:
         :return [str]: All outputs produced by the code (list of lines).
         '''
         
-        marker = '<<<done>>>'
+        with self._cmd_lock:
+            if self.pending:
+                raise RuntimeError(
+                    'Hub is still executing code sent without waiting for ' \
+                    'results.'
+                )
+            if self.recording is not None:
+                self.recording.append(code)
+                caller = sys._getframe(1).f_locals.get('self')
+                if isinstance(caller, Motor):
+                    self.recorded_motors.add(caller)
+            
+            if self.profiling and not self.checking_ports:
+                return self._profiled_cmd(code, sys._getframe(1))
+            
+            self._send(code)
+            
+            return self._receive()
+
+
+    def set_profiling(self, enabled=True):
+        '''
+        Enable or disable profiling of commands.
+        
+        :param bool enabled: Profile all following commands?
+        
+        If profiling is enabled, the hub measures compile and execution time of
+        each command sent via [](#cmd). Together with send and round trip times
+        measured on the host this yields one record per command (see
+        [](#get_profile)). Enabling profiling clears all previous records.
+        
+        Commands are sent as string literals (one per top-level statement) to
+        a small timing function on the hub. Thus, compile times include parsing
+        of the command, but not the (small) overhead of the timing function's
+        call.
+        
+        ```{note}
+        Without profiling, [](#cmd) sends multi-line commands line by line with
+        additional blank lines for the interpreter's autoindentation. With
+        profiling, each command is sent as one line. Thus, send and wire times
+        of multi-line commands are not representative for sending them without
+        profiling. For single-line commands only a few bytes are added.
+        ```
+        '''
+        
+        if enabled:
+            self.cmd('import sys')
+            self.cmd('import time')
+            ret = self.cmd(f'exec({_PROF_CODE!r})')
+            logger.debug(f'definition of _prof in Hub.set_profiling returned {ret}')
+            self.profile = []
+        self.profiling = enabled
+        
+        
+    def get_profile(self, aggregate=True):
+        '''
+        Get results of profiling (see [](#set_profiling)).
+        
+        :param bool aggregate: Combine records per calling method?
+        :return: If `aggregate` is `False`, list of dicts, one per command, with
+                 keys `'method'` (calling function or method), `'code'`,
+                 `'send'` (time for writing code to the serial connection),
+                 `'compile'` (compile time on hub), `'execute'` (execution
+                 time on hub), `'wire'` (total time minus compile and execution
+                 time) and `'total'` (round trip time). All times are in
+                 seconds. If `aggregate` is `True`, dict with calling methods
+                 as keys and dicts as values. These dicts have key `'calls'`
+                 (number of commands) and keys `'send'`, `'compile'`,
+                 `'execute'`, `'wire'`, `'total'` (mean times in seconds).
+        '''
+        
+        if not aggregate:
+            return self.profile
+        
+        keys = ['send', 'compile', 'execute', 'wire', 'total']
+        report = {}
+        for record in self.profile:
+            item = report.setdefault(
+                record['method'], {'calls': 0, **{key: 0 for key in keys}}
+            )
+            item['calls'] += 1
+            for key in keys:
+                item[key] += record[key]
+        for item in report.values():
+            for key in keys:
+                item[key] /= item['calls']
+        
+        return report
+        
+
+    def _profiled_cmd(self, code, frame):
+        '''
+        Send Python code to the hub with timing (see set_profiling).
+        '''
+        
+        # name of calling function or method
+        method = frame.f_code.co_name
+        if 'self' in frame.f_locals:
+            method = f'{type(frame.f_locals["self"]).__name__}.{method}'
+        
+        # split into top-level statements
+        try:
+            statements = [
+                ast.get_source_segment(code, node)
+                for node in ast.parse(code).body
+            ]
+        except SyntaxError:
+            statements = [code]  # let the hub report the error
+        
+        start = time.perf_counter()
+        self._send(f'_prof({statements!r})')
+        self.connection.flush()
+        sent = time.perf_counter()
+        ret = self._receive()
+        end = time.perf_counter()
+        
+        # separate hub's timing output from command's output
+        compile_time = 0
+        execute_time = 0
+        output = []
+        for line in ret:
+            if line.startswith(_PROF_MARKER):
+                compile_us, execute_us = line[len(_PROF_MARKER):].split()
+                compile_time = int(compile_us) / 1e6
+                execute_time = int(execute_us) / 1e6
+            else:
+                output.append(line)
+        
+        self.profile.append({
+            'method': method,
+            'code': code,
+            'send': sent - start,
+            'compile': compile_time,
+            'execute': execute_time,
+            'wire': end - start - compile_time - execute_time,
+            'total': end - start
+        })
+        
+        return output
+
+
+    def _send(self, code):
+        '''
+        Send Python code to the hub without waiting for results.
+        '''
         
         # insert line breaks to cope with the interpreter's autoindentation
         lines = code.split('\n')
@@ -125,15 +357,20 @@ class Hub:
             
         # send code
         self.write('\n'.join(lines))
-        self.write('#' + marker)
+        self.write('#' + _MARKER)
+        
+
+    def _receive(self):
+        '''
+        Wait till code sent by _send has been executed and collect outputs.
+        '''
         
-        # wait till executed and collect outputs
         output = []
         while True:
             line = self.readline()
             if line == '':
                 continue
-            if line.find(marker) > -1:
+            if line.find(_MARKER) > -1:
                 break
             if line[:3] != '>>>' and line[:3] != '...':
                 output.append(line)
@@ -154,8 +391,271 @@ class Hub:
                             port.
         '''
         
+        return {port: item['id'] for port, item in self.get_inventory().items()}
+
+
+    def get_inventory(self):
+        '''
+        Get IDs and motor properties of devices connected to the hub with one
+        command.
+        
+        :return dict(str=dict): Dictionary with keys `'A'`, `'B'`, `'C'`,
+                                `'D'`, `'E'`, `'F'` and dicts as values. Each
+                                dict has keys `'id'` (device ID as in
+                                [](#list_devices)) and `'max_speed'` (maximum
+                                speed of a motor, `None` for other devices).
+        '''
+        
+        with self._cmd_lock:
+            if not self.inventory_defined:
+                self.cmd('import motor')
+                ret = self.cmd(f'exec({_INVENTORY_CODE!r})')
+                logger.debug(
+                    f'definition of _inv in Hub.get_inventory returned {ret}'
+                )
+                self.inventory_defined = True
+            ret = self.cmd('_inv()')
+        logger.debug(f'_inv in Hub.get_inventory returned {ret}')
+        
+        return {
+            port: {'id': dev_id, 'max_speed': max_speed}
+            for port, (dev_id, max_speed)
+            in zip(['A', 'B', 'C', 'D', 'E', 'F'], ast.literal_eval(ret[-1]))
+        }
+    
+    
+    def create_devices(self, **kwargs):
+        '''
+        Create device objects for all motors and sensors connected to the hub.
+        
+        :param kwargs: Keyword arguments passed to [](#Motor) objects'
+                       constructor. Only `lock`, `speed`, `acc` and `dec` are
+                       accepted (maximum speed is read from the hub).
+        :return dict(str=object): Dictionary with ports as keys and
+                                  [](#Motor), [](#ColorSensor),
+                                  [](#DistanceSensor), [](#ForceSensor)
+                                  objects as values. Ports without device or
+                                  with unsupported devices are missing.
+        '''
+        
+        unknown = set(kwargs) - {'lock', 'speed', 'acc', 'dec'}
+        if unknown:
+            raise TypeError(f'Unexpected keyword arguments {sorted(unknown)}.')
+        
         devices = {}
-        for num, port in enumerate(['A', 'B', 'C', 'D', 'E', 'F']):
-            devices[port] = int(self.cmd(f'try:\n    print(device.id({num}))\nexcept:\n    print(0)\n')[0])
+        for port, item in self.get_inventory().items():
+            device_class = _DEVICE_CLASSES.get(item['id'])
+            if device_class is Motor:
+                devices[port] = Motor(self, port, max_speed=item['max_speed'],
+                                      **kwargs)
+            elif device_class:
+                devices[port] = device_class(self, port)
         
         return devices
+
+
+    def watch_devices(self, callback, interval=1):
+        '''
+        Watch ports for connected and disconnected devices.
+        
+        :param callback: Function called with arguments port (`'A'`,...,
+                         `'F'`), old device ID and new device ID whenever the
+                         device ID of a port changes. Called from a background
+                         thread.
+        :param float interval: Seconds between checks.
+        
+        Ports are checked by a background thread sending one command per
+        check. Commands from other threads are delayed until a check is
+        completed and vice versa. While code sent without waiting for results
+        is running on the hub (e.g. [](#Trajectory.start)) or while a macro is
+        defined, no checks are done. Checks are not profiled (see
+        [](#set_profiling)). Stop watching with [](#stop_watching).
+        '''
+        
+        self.stop_watching()
+        self.watching = threading.Event()
+        self.watcher = threading.Thread(
+            target=self._watch, args=(callback, interval, self.watching),
+            daemon=True
+        )
+        self.watcher.start()
+        
+        
+    def stop_watching(self):
+        '''
+        Stop watching ports (see [](#watch_devices)).
+        '''
+        
+        if self.watcher:
+            self.watching.set()
+            if threading.current_thread() is not self.watcher:
+                self.watcher.join()
+            self.watcher = None
+            
+            
+    def _watch(self, callback, interval, stopping):
+        '''
+        Check ports until stopping is set (see watch_devices).
+        '''
+        
+        devices = None
+        while not stopping.is_set():
+            new_devices = None
+            with self._cmd_lock:
+                if not self.pending and self.recording is None:
+                    self.checking_ports = True
+                    try:
+                        new_devices = self.list_devices()
+                    except Exception:
+                        logger.exception('Checking ports failed.')
+                    finally:
+                        self.checking_ports = False
+            if new_devices:
+                if devices:
+                    for port, dev_id in new_devices.items():
+                        if stopping.is_set():
+                            break
+                        if dev_id != devices[port]:
+                            try:
+                                callback(port, devices[port], dev_id)
+                            except Exception:
+                                logger.exception(
+                                    'Callback for port watching failed.'
+                                )
+                devices = new_devices
+            stopping.wait(interval)
+
+
+    def define_macro(self, name, func, **args):
+        '''
+        Define a function on the hub from a sequence of commands.
+        
+        :param str name: Name of the macro (has to be a valid Python name not
+                         used otherwise on the hub, else `ValueError` is
+                         raised).
+        :param func: Function without return value executing the commands of
+                     the macro via [](#cmd) or device objects. Called with one
+                     placeholder per macro argument.
+        :param args: Sample values for the macro's arguments (keyword
+                     arguments, names are the macro's argument names). Names
+                     must not be used otherwise on the hub (e.g. `motor`,
+                     `device`, `time`), else `ValueError` is raised.
+        
+        To define the macro `func` is executed once with the sample values
+        (that is, commands are executed on the hub during definition). All
+        commands sent to this hub are recorded and combined into a function on
+        the hub. Later, [](#call_macro) runs all commands with one short
+        command.
+        
+        Placeholders for arguments are replaced by their names in command
+        strings. Thus, they can be passed to device methods which insert values
+        into the commands sent to the hub as is (e.g.
+        [](#LightMatrix.set_pixel)), but not to methods doing computations with
+        their arguments on the host (e.g. [](#Motor.run_degrees)).
+        '''
+        
+        # names must not hide names used by other commands (redefining a
+        # macro is okay)
+        names = list(args.keys())
+        if name not in self.macros:
+            names.append(name)
+        ret = self.cmd(f'print([n for n in {names!r} if n in globals()])')
+        used = ast.literal_eval(ret[-1])
+        if used:
+            raise ValueError(f'Names {used} are already used on the hub.')
+        
+        # sample values as global variables on the hub for executing func
+        for arg_name, value in args.items():
+            self.cmd(f'{arg_name} = {value!r}')
+        
+        # execute func and record commands
+        with self._cmd_lock:
+            self.recording = []
+            self.recorded_motors = set()
+            try:
+                func(*[_MacroArg(arg_name) for arg_name in args.keys()])
+                codes = self.recording
+                motors = self.recorded_motors
+            finally:
+                self.recording = None
+                self.recorded_motors = set()
+                for arg_name in args.keys():
+                    self.cmd(f'del {arg_name}')
+        
+        # function definition (expressions' values are shown like in the
+        # interactive interpreter)
+        lines = [f'def {name}({", ".join(args.keys())}):']
+        for code in codes:
+            try:
+                ast.parse(code, mode='eval')
+                code = f'_x = ({code})\nif _x is not None: print(repr(_x))'
+            except SyntaxError:
+                pass
+            lines.extend('    ' + line for line in code.split('\n') if line)
+        if not codes:
+            lines.append('    pass')
+        
+        # send as one line to avoid autoindentation and padding
+        source = '\n'.join(lines)
+        ret = self.cmd(f'exec({source!r})')
+        logger.debug(f'definition of macro {name} returned {ret}')
+        self.macros[name] = (list(args.keys()), motors)
+        
+
+    def call_macro(self, name, *args):
+        '''
+        Run a macro defined by [](#define_macro).
+        
+        :param str name: Name of the macro.
+        :param args: Values for the macro's arguments.
+        :return [str]: All outputs produced by the macro's commands (list of
+                       lines). These are the lines [](#cmd) would have returned
+                       for the macro's commands one after the other.
+        
+        Raises `RuntimeError` if the macro raised an exception on the hub.
+        
+        [](#Motor) objects used by the macro lose their predicted positions
+        (see [](#Motor.get_position)), because the macro's motor commands don't
+        update the motors' state models.
+        '''
+        
+        arg_names, motors = self.macros[name]
+        if len(args) != len(arg_names):
+            raise TypeError(
+                f'Macro {name} takes {len(arg_names)} arguments ' \
+                f'({len(args)} given).'
+            )
+        
+        ret = self.cmd(f'{name}({", ".join(repr(arg) for arg in args)})')
+        logger.debug(f'macro {name} returned {ret}')
+        
+        for motor in motors:
+            motor._forget_state()
+        
+        if any(line.startswith('Traceback') for line in ret):
+            raise RuntimeError(f'Macro {name} failed: {ret}')
+        
+        return ret
+
+
+class _MacroArg:
+    ''' Placeholder for a macro argument (see Hub.define_macro). '''
+    
+    def __init__(self, name):
+        
+        self.name = name
+        
+        
+    def __str__(self):
+        
+        return self.name
+    
+    
+    def __repr__(self):
+        
+        return self.name
+    
+    
+    def __format__(self, spec):
+        
+        return self.name
@@ -2,10 +2,17 @@ import time
 
 from . import logger
 
+# relative deviation of motor speed from commanded speed assumed for prediction
+_SPEED_TOLERANCE = 0.05
+
+# time in seconds a motor may need to come to rest after power is turned off
+_COAST_TIME = 0.5
+
 class Motor:
     ''' A motor connected to a hub block. '''
     
-    def __init__(self, hub, port, lock=False, speed=50, acc=100, dec=100):
+    def __init__(self, hub, port, lock=False, speed=50, acc=100, dec=100,
+                 max_speed=None):
         '''
         Prepare hub for motor usage and set motor settings.
     
@@ -19,6 +26,9 @@ class Motor:
                           acceleration.
         :param float dec: Default deceleration in percent of maximum
                           deceleration.
+        :param int max_speed: Maximum speed of the motor in degrees per second.
+                              If `None`, maximum speed is read from the hub
+                              (see also [](#Hub.get_inventory)).
         '''
 
         self.hub = hub
@@ -27,14 +37,21 @@ class Motor:
         self.hub.cmd('import motor')
         
         # get maximum speed
-        ret = self.hub.cmd(f'motor.info({self.port})[1]')
-        self.max_speed = int(ret[-1])
+        if max_speed is None:
+            ret = self.hub.cmd(f'motor.info({self.port})[1]')
+            max_speed = int(ret[-1])
+        self.max_speed = max_speed
         
         # relative to absolute
         self.speed = int(speed / 100 * self.max_speed)
         self.acc = int(acc / 100 * 10000)
         self.dec = int(dec / 100 * 10000)
         
+        # motor state model for predicting positions (see get_position)
+        self.command = None  # last command (speed, acceleration, degrees)
+        self.state = None  # last known position, None if unknown
+        self.coast_until = 0  # motor may still coast before this time
+
         # stop and (un)lock motor
         self.lock = lock
         self.start(speed=0, acc=0)
@@ -64,6 +81,7 @@ class Motor:
             f'motor.run({self.port}, {speed}, acceleration={acc})'
         )
         logger.debug(f'motor.run in Motor.start returned {ret}')
+        self._commanded(speed, acc)
         
 
     def stop(self, lock=None):
@@ -82,6 +100,14 @@ class Motor:
         ret = self.hub.cmd(f'motor.stop({self.port}, stop={int(lock)})')
         logger.debug(f'motor.stop in Motor.stop returned {ret}')
         
+        # no controlled deceleration, so position is unknown while coasting
+        now = time.monotonic()
+        if not self.command or self.command['speed'] != 0:
+            self.coast_until = now + _COAST_TIME
+        self.command = {'speed': 0, 'time': now, 'acc': 0, 'dec': 0,
+                        'ramp_end': now, 'remaining': None}
+        self.state = None
+        
      
     def run_degrees(self, degrees, speed=None, acc=None, dec=None, lock=None,
                     wait=False):
@@ -129,6 +155,7 @@ class Motor:
         logger.debug(
             f'motor.run_for_degrees in Motor.run_degrees returned {ret}'
         )
+        self._commanded(speed, acc, degrees, dec)
         
         if wait:
             started = False
@@ -145,16 +172,219 @@ class Motor:
                 time.sleep(0.1)
 
 
-    def get_position(self):
+    def get_position(self, max_age=None, max_error=None):
         '''
         Read current position in degrees.
         
+        :param float max_age: If not `None`, the position may be predicted from
+                              the last measurement and the commands sent since
+                              then instead of asking the hub. Prediction is
+                              used only if the last measurement is not older
+                              than `max_age` seconds.
+        :param float max_error: If not `None`, a predicted position is used
+                                only if the estimated prediction error does not
+                                exceed `max_error` degrees.
         :return int: Current position in degrees.
+        
+        If both `max_age` and `max_error` are `None` (default), the position is
+        always read from the hub.
+        
+        Prediction assumes that the motor follows the commands sent via
+        [](#start), [](#stop) and [](#run_degrees) with a speed deviation of at
+        most 5 percent. The estimated error accounts for acceleration phases,
+        for deceleration at the end of [](#run_degrees) and for uncertainty
+        about the remaining degrees of [](#run_degrees).
+        After [](#stop) the position is read from the hub until the motor has
+        come to rest. Moving the motor by hand or blocking it cannot be
+        detected by prediction.
         '''
         
+        if max_age is not None or max_error is not None:
+            prediction = self._predict(time.monotonic())
+            if prediction:
+                pos, age, error = prediction
+                if (max_age is None or age <= max_age) \
+                   and (max_error is None or error <= max_error):
+                    return pos
+        
         ret = self.hub.cmd(f'motor.absolute_position({self.port})')
         logger.debug(
             f'motor.absolute_position in Motor.get_position returned {ret}'
         )
-        return int(ret[-1])
-    
\ No newline at end of file
+        pos = int(ret[-1])
+        self._measured(pos)
+        
+        return pos
+
+
+    def _forget_state(self):
+        '''
+        Mark motor state as unknown (e.g. after commands sent by other
+        objects). The motor may be moving.
+        '''
+        
+        self.command = None
+        self.state = None
+        
+        
+    def _commanded(self, speed, acc, degrees=None, dec=0):
+        '''
+        Update motor state model after sending a speed command.
+        '''
+        
+        now = time.monotonic()
+        prediction = self._predict(now)
+        if self.command:
+            speed_change = abs(speed - self.command['speed'])
+        else:
+            # previous speed unknown
+            speed_change = abs(speed) + self.max_speed
+        ramp_time = speed_change / acc if acc > 0 else 0
+        self.command = {
+            'speed': speed,
+            'time': now,
+            'acc': acc,
+            'dec': dec,
+            'ramp_end': now + ramp_time,
+            'remaining': None if degrees is None else abs(degrees)
+        }
+        
+        if not prediction:
+            return
+        pos, age, error = prediction
+        self.state = {
+            'pos': pos,
+            'time': now,
+            'measured': now - age,
+            'speed': speed,
+            'remaining': self.command['remaining'],
+            'remaining_error': 0,
+            'error': error
+        }
+        
+        
+    def _measured(self, pos):
+        '''
+        Update motor state model after reading the position.
+        '''
+        
+        now = time.monotonic()
+        if now < self.coast_until or not self.command:
+            self.state = None
+            return
+        
+        remaining = None
+        remaining_error = 0
+        if self.state and self.state['remaining'] is not None:
+            # measured travel (prediction resolves multiples of 360 degrees)
+            pred_pos, _, _ = self._predict(now)
+            travel = abs(self._travel(now) + (pos - pred_pos + 180) % 360 - 180)
+            remaining = max(0, self.state['remaining'] - travel)
+            
+            # end position is known up to error of reference position
+            remaining_error = self.state['error'] \
+                              + self.state['remaining_error']
+            start = self.state['time']
+            start_remaining = self.state['remaining']
+        elif self.command['remaining'] is not None:
+            # position at command time unknown, so take the mean of possible
+            # travels since command time
+            travel = abs(self.command['speed']) * (now - self.command['time'])
+            remaining = max(0, self.command['remaining'] - travel / 2)
+            remaining_error = travel / 2
+            start = self.command['time']
+            start_remaining = self.command['remaining']
+        
+        # motor has reached end position and stands still
+        if remaining is not None \
+           and now >= self._end_time(start, start_remaining, remaining_error):
+            self.command['speed'] = 0
+            self.command['remaining'] = None
+            remaining = None
+            remaining_error = 0
+        
+        self.state = {
+            'pos': pos,
+            'time': now,
+            'measured': now,
+            'speed': self.command['speed'],
+            'remaining': remaining,
+            'remaining_error': remaining_error,
+            'error': 0
+        }
+        
+        
+    def _end_time(self, start, remaining, remaining_error):
+        '''
+        Latest time the motor stops after running remaining degrees from start
+        time on (including acceleration and deceleration).
+        '''
+        
+        speed = abs(self.command['speed'])
+        dec = self.command['dec']
+        if speed == 0:
+            return start
+        
+        ramp_time = max(0, self.command['ramp_end'] - start)
+        brake_time = speed / dec if dec > 0 else 0
+        
+        return start + (remaining + remaining_error) / speed + ramp_time \
+               + brake_time
+        
+        
+    def _travel(self, now):
+        '''
+        Predicted travel in degrees since last state update (signed).
+        '''
+        
+        travel = self.state['speed'] * (now - self.state['time'])
+        remaining = self.state['remaining']
+        if remaining is not None and abs(travel) > remaining:
+            travel = remaining if travel > 0 else -remaining
+        
+        return travel
+        
+        
+    def _predict(self, now):
+        '''
+        Predict position from motor state model.
+        
+        :return (int, float, float): Tuple `(pos, age, error)` with predicted
+                                     position, age of the measurement the
+                                     prediction is based on and estimated error
+                                     in degrees. `None` if position is unknown.
+        '''
+        
+        if not self.state:
+            return None
+        
+        speed = self.state['speed']
+        travel = self._travel(now)
+        remaining = self.state['remaining']
+        error = self.state['error'] + _SPEED_TOLERANCE * abs(travel)
+        
+        if remaining is not None:
+            unclamped_travel = abs(speed) * (now - self.state['time'])
+            
+            # lag due to deceleration while prediction is within braking
+            # distance of the end position
+            dec = self.command['dec']
+            if dec > 0:
+                brake_distance = speed ** 2 / (2 * dec)
+                if abs(remaining - unclamped_travel) \
+                   <= brake_distance + self.state['remaining_error']:
+                    error += brake_distance
+            
+            # prediction stops at uncertain end position
+            if unclamped_travel >= remaining:
+                error += self.state['remaining_error']
+        
+        # lag or lead not yet accumulated due to acceleration
+        acc = self.command['acc']
+        ramp_time = max(0, self.command['ramp_end'] - self.state['time'])
+        error += acc * ramp_time ** 2 / 2
+        
+        pos = (round(self.state['pos'] + travel) + 180) % 360 - 180
+        age = now - self.state['measured']
+        
+        return pos, age, error
@@ -0,0 +1,174 @@
+import multiprocessing
+
+from . import logger
+from .hub import Hub
+
+class Runner:
+    '''
+    Control several hub blocks in parallel, one worker process per hub.
+    '''
+
+    def __init__(self, ports, setup, step, action_size, obs_size):
+        '''
+        Start one worker process per hub and connect each worker to its hub.
+
+        :param [str] ports: Device names of the hubs at the host machine (e.g.
+                            `['/dev/ttyACM0', '/dev/ttyACM1']`).
+        :param setup: Function called once in each worker process with the
+                      worker's [](#Hub) object as argument. Create all device
+                      objects there. The return value is passed to `step`.
+        :param step: Function called in a worker process for each step with
+                     the return value of `setup` and the hub's list of
+                     actions (floats). Has to return a sequence of
+                     `obs_size` floats (the hub's observation).
+        :param int action_size: Number of actions per hub.
+        :param int obs_size: Number of observations per hub.
+
+        Actions and observations are exchanged via shared memory. Thus, they
+        are not pickled at each step. Functions `setup` and `step` have to be
+        defined at module level (they are passed to the worker processes once).
+        '''
+
+        self.num_hubs = len(ports)
+        self.action_size = action_size
+        self.obs_size = obs_size
+
+        # shared memory (one row per hub)
+        self.actions = multiprocessing.Array(
+            'd', self.num_hubs * action_size, lock=False
+        )
+        self.obs = multiprocessing.Array(
+            'd', self.num_hubs * obs_size, lock=False
+        )
+        self.failed = multiprocessing.Array('b', self.num_hubs, lock=False)
+
+        # start workers
+        self.go = [multiprocessing.Event() for _ in ports]
+        self.done = [multiprocessing.Event() for _ in ports]
+        self.stopping = multiprocessing.Event()
+        self.workers = []
+        for i, port in enumerate(ports):
+            worker = multiprocessing.Process(
+                target=_work,
+                args=(i, port, setup, step, action_size, obs_size,
+                      self.actions, self.obs, self.failed,
+                      self.go[i], self.done[i], self.stopping),
+                daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+        # wait till all hubs are connected
+        self._wait()
+        self._check('setup')
+
+
+    def step(self, actions):
+        '''
+        Send actions to all hubs and wait for all observations.
+
+        :param [[float]] actions: One list of `action_size` actions per hub.
+        :return [[float]]: One list of `obs_size` observations per hub.
+        '''
+
+        if len(actions) != self.num_hubs:
+            raise ValueError(
+                f'Expected actions for {self.num_hubs} hubs, got {len(actions)}.'
+            )
+
+        for i, hub_actions in enumerate(actions):
+            if len(hub_actions) != self.action_size:
+                raise ValueError(
+                    f'Expected {self.action_size} actions for hub {i}, ' \
+                    f'got {len(hub_actions)}.'
+                )
+
+        for i, hub_actions in enumerate(actions):
+            start = i * self.action_size
+            self.actions[start:start + self.action_size] = list(hub_actions)
+        for go in self.go:
+            go.set()
+        self._wait()
+        self._check('step')
+
+        return [
+            self.obs[i * self.obs_size:(i + 1) * self.obs_size]
+            for i in range(self.num_hubs)
+        ]
+
+
+    def close(self):
+        '''
+        Stop worker processes and disconnect all hubs.
+        '''
+
+        self.stopping.set()
+        for go in self.go:
+            go.set()
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                logger.warning(f'Terminating worker {worker.name}.')
+                worker.terminate()
+
+
+    def _wait(self):
+        '''
+        Wait till all workers are done or died.
+        '''
+
+        for i, worker in enumerate(self.workers):
+            while not self.done[i].wait(timeout=0.1):
+                if not worker.is_alive():
+                    logger.error(f'Worker for hub {i} died.')
+                    self.failed[i] = 1
+                    break
+            self.done[i].clear()
+
+
+    def _check(self, what):
+        '''
+        Raise an exception if some worker failed.
+        '''
+
+        failed = [i for i in range(self.num_hubs) if self.failed[i]]
+        if failed:
+            self.close()
+            raise RuntimeError(
+                f'{what} failed for hubs {failed} (see log for details).'
+            )
+
+
+def _work(i, port, setup, step, action_size, obs_size, actions, obs, failed,
+          go, done, stopping):
+    '''
+    Worker process for one hub.
+    '''
+
+    hub = None
+    try:
+        hub = Hub(port)
+        state = setup(hub)
+    except Exception:
+        logger.exception(f'Setup of hub {port} failed.')
+        failed[i] = 1
+        done.set()
+        if hub:
+            hub.disconnect()
+        return
+    done.set()
+
+    while True:
+        go.wait()
+        go.clear()
+        if stopping.is_set():
+            break
+        try:
+            hub_obs = step(state, actions[i * action_size:(i + 1) * action_size])
+            obs[i * obs_size:(i + 1) * obs_size] = list(hub_obs)
+        except Exception:
+            logger.exception(f'Step on hub {port} failed.')
+            failed[i] = 1
+        done.set()
+
+    hub.disconnect()
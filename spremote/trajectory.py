@@ -0,0 +1,204 @@
+import ast
+import itertools
+
+from . import logger
+
+# numbers for naming trajectory data on the hub
+_numbers = itertools.count()
+
+# code for executing trajectories on the hub (sent by each upload, redefining
+# the function is harmless)
+_RUN_CODE = '''
+def _tr_run(times, motors):
+    starts = [motor.relative_position(m[0]) for m in motors]
+    log = [[] for m in motors]
+    t0 = time.ticks_ms()
+    for i in range(len(times)):
+        time.sleep_ms(max(0, times[i] - time.ticks_diff(time.ticks_ms(), t0)))
+        t = time.ticks_diff(time.ticks_ms(), t0)
+        for j in range(len(motors)):
+            port, mode, values, speed = motors[j]
+            pos = motor.relative_position(port) - starts[j]
+            if mode == 0:
+                motor.run(port, values[i])
+            else:
+                motor.run_to_relative_position(port, starts[j] + values[i], speed)
+            log[j].append((t, values[i], pos))
+    return log
+'''
+
+class Trajectory:
+    '''
+    Speed or position profiles for one or more motors executed by the hub.
+    '''
+
+    def __init__(self, hub, times):
+        '''
+        Prepare a trajectory.
+
+        :param Hub hub: [](#Hub) object the motors are connected to.
+        :param [float] times: Increasing times in seconds (relative to start of
+                              the trajectory) at which new speeds or positions
+                              are commanded.
+
+        Add speed or position profiles for motors with [](#add_speeds) and
+        [](#add_positions), then send everything to the hub with [](#upload).
+        [](#start) executes the trajectory, timed by the hub's clock, without
+        further communication. [](#wait) waits for the end of the trajectory
+        and returns the tracking log. Then trajectory data is removed from the
+        hub to free memory. To run the trajectory again, call [](#upload)
+        again.
+        '''
+
+        if any(t1 >= t2 for t1, t2 in zip(times[:-1], times[1:])):
+            raise ValueError('Times have to be increasing.')
+
+        self.hub = hub
+        self.times = [round(1000 * t) for t in times]
+        self.motors = []
+        self.profiles = []
+        self.name = f'_tr_data{next(_numbers)}'  # data's name on the hub
+        self.running = False
+        self.uploaded = False
+        self.hub.cmd('import time')
+        self.hub.cmd('import motor')
+
+
+    def add_speeds(self, motor, speeds):
+        '''
+        Add a speed profile for a motor.
+
+        :param Motor motor: [](#Motor) object.
+        :param [float] speeds: Speeds in percent of maximum speed, one per time
+                               point (sign is direction of rotation). Speeds
+                               are held until the next time point. The last
+                               speed is held after the end of the trajectory.
+        '''
+
+        self._check_length(speeds)
+        values = [int(s / 100 * motor.max_speed) for s in speeds]
+        self.motors.append(motor)
+        self.profiles.append((motor.port, 0, values, 0))
+
+
+    def add_positions(self, motor, positions, speed=None):
+        '''
+        Add a position profile for a motor.
+
+        :param Motor motor: [](#Motor) object.
+        :param [float] positions: Target positions in degrees relative to the
+                                  motor's position at start of the trajectory,
+                                  one per time point.
+        :param float speed: Speed for moving to targets in percent of maximum
+                            speed. If `None`, default speed is used.
+        '''
+
+        self._check_length(positions)
+        if speed:
+            speed = int(speed / 100 * motor.max_speed)
+        else:
+            speed = motor.speed
+        values = [int(p) for p in positions]
+        self.motors.append(motor)
+        self.profiles.append((motor.port, 1, values, speed))
+
+
+    def upload(self):
+        '''
+        Send trajectory data to the hub.
+
+        Data stays on the hub until [](#wait) returns or [](#delete) is called.
+        '''
+
+        ret = self.hub.cmd(f'exec({_RUN_CODE!r})')
+        logger.debug(f'definition of _tr_run in Trajectory.upload returned {ret}')
+        ret = self.hub.cmd(f'{self.name} = ({self.times!r}, {self.profiles!r})')
+        logger.debug(f'{self.name} in Trajectory.upload returned {ret}')
+        self.uploaded = True
+
+
+    def delete(self):
+        '''
+        Remove uploaded trajectory data from the hub (to free memory).
+        '''
+
+        if self.uploaded:
+            ret = self.hub.cmd(f'del {self.name}')
+            logger.debug(f'del {self.name} in Trajectory.delete returned {ret}')
+            self.uploaded = False
+
+
+    def start(self):
+        '''
+        Start execution of uploaded trajectory and return immediately.
+
+        Until [](#wait) is called no other commands can be sent to the hub.
+        '''
+
+        if not self.uploaded:
+            raise RuntimeError('Trajectory has not been uploaded.')
+
+        # positions are unknown to the motors' state models while running
+        for motor in self.motors:
+            motor._forget_state()
+
+        with self.hub._cmd_lock:
+            if self.hub.pending:
+                raise RuntimeError(
+                    'Hub is still executing code sent without waiting for ' \
+                    'results.'
+                )
+            self.hub._send(f'print(_tr_run(*{self.name}))')
+            self.hub.pending = True
+            self.running = True
+
+
+    def wait(self):
+        '''
+        Wait till trajectory has been executed and get the tracking log.
+
+        :return [[(float, float, int)]]: One list per motor (in order of adding
+                                         profiles) with one tuple per time
+                                         point. Tuples contain time in seconds
+                                         since start, commanded speed (percent
+                                         of maximum speed) or position
+                                         (degrees) and measured position
+                                         (degrees relative to start position)
+                                         at the moment the command was issued.
+        '''
+
+        if not self.running:
+            raise RuntimeError('Trajectory has not been started.')
+
+        ret = self.hub._receive()
+        self.hub.pending = False
+        self.running = False
+        logger.debug(f'_tr_run in Trajectory.wait returned {ret}')
+        self.delete()
+
+        try:
+            hub_log = ast.literal_eval(ret[-1])
+        except (IndexError, ValueError, SyntaxError):
+            raise RuntimeError(f'Trajectory execution failed: {ret}')
+
+        log = []
+        for motor, profile, motor_log in zip(self.motors, self.profiles,
+                                             hub_log):
+            if profile[1] == 0:
+                log.append([(t / 1000, v / motor.max_speed * 100, p)
+                            for t, v, p in motor_log])
+            else:
+                log.append([(t / 1000, v, p) for t, v, p in motor_log])
+
+        return log
+
+
+    def _check_length(self, values):
+        '''
+        Raise an exception if a profile doesn't match the time points.
+        '''
+
+        if len(values) != len(self.times):
+            raise ValueError(
+                f'Expected {len(self.times)} values, got {len(values)}.'
+            )